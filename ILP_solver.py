@@ -1,13 +1,80 @@
 import gurobipy as gp
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
 import json
 from itertools import combinations
 from gurobipy import GRB
 import time
-from typing import List, Set, Dict, Tuple
+from typing import List, Set, Dict, Tuple, Optional
 import os
 import traceback
 
+# --- Sparse constraint-matrix builders ---
+# Rows are generated as whole NumPy blocks: each block is a (rows, terms)
+# array of column indices sharing one coefficient pattern and right-hand side.
+
+def pair_columns(i, j, N):
+    """Column of the "node i before node j" variable (works on scalars and arrays)."""
+    return i * (N - 1) + j - (j > i)
+
+
+def ordering_block(N):
+    """x[i,j] + x[j,i] == 1 for every unordered node pair."""
+    i, j = np.triu_indices(N, 1)
+    cols = np.stack([pair_columns(i, j, N), pair_columns(j, i, N)], axis=1)
+    return cols, (1.0, 1.0), 1.0
+
+
+def transitivity_block(N):
+    """x[a,b] + x[b,c] - x[a,c] <= 1 for every ordered triple of distinct nodes."""
+    idx = np.arange(N, dtype=np.int32)
+    a, b, c = (t.ravel() for t in np.meshgrid(idx, idx, idx, indexing="ij"))
+    keep = (a != b) & (b != c) & (a != c)
+    a, b, c = a[keep], b[keep], c[keep]
+    cols = np.stack([pair_columns(a, b, N), pair_columns(b, c, N), pair_columns(a, c, N)], axis=1)
+    return cols, (1.0, 1.0, -1.0), 1.0
+
+
+def crossing_block(a, b, c, d, x_edge, N):
+    """
+    Edges (a,b) and (c,d) cross in any of the 8 interleaved orders; each order
+    forces its crossing variable to 1. With x_edge=None the crossing is
+    forbidden outright (the variable is substituted by 0).
+    """
+    patterns = (
+        ((a, c), (c, b), (b, d)),
+        ((b, c), (c, a), (a, d)),
+        ((a, d), (d, b), (b, c)),
+        ((b, d), (d, a), (a, c)),
+        ((c, a), (a, d), (d, b)),
+        ((c, b), (b, d), (d, a)),
+        ((d, a), (a, c), (c, b)),
+        ((d, b), (b, c), (c, a)),
+    )
+    terms = [] if x_edge is None else [x_edge]
+    cols = np.concatenate([
+        np.stack([pair_columns(*p, N), pair_columns(*q, N), pair_columns(*r, N)] + terms, axis=1)
+        for p, q, r in patterns
+    ])
+    return cols, (1.0, 1.0, 1.0, -1.0)[:cols.shape[1]], 2.0
+
+
+def stack_blocks(blocks, n_vars):
+    """Assemble row blocks into one CSR matrix and right-hand-side vector."""
+    rows, cols, data, rhs = [], [], [], []
+    offset = 0
+    for block_cols, coefs, bound in blocks:
+        n_rows, n_terms = block_cols.shape
+        rows.append(np.repeat(np.arange(offset, offset + n_rows, dtype=np.int32), n_terms))
+        cols.append(block_cols.ravel())
+        data.append(np.tile(np.asarray(coefs, dtype=np.float64), n_rows))
+        rhs.append(np.full(n_rows, bound, dtype=np.float64))
+        offset += n_rows
+    A = sp.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(offset, n_vars))
+    return A, np.concatenate(rhs)
+
+
 # ⚠️ IMPORTANT: Keep the original function name that the server expects
 def solve_layout_for_graph(graph_json_path: str, time_limit: int = 3600) -> List[str]:
     """
@@ -26,33 +93,55 @@ def solve_layout_for_graph(graph_json_path: str, time_limit: int = 3600) -> List
 
         print(f"DEBUG: Loaded {len(data['nodes'])} nodes, {len(data['edges'])} edges from {graph_json_path}")
 
-        # Build graph
-        G = nx.DiGraph()
+        # Build hierarchy and edge-type lookups
+        parent: Dict[str, Optional[str]] = {}
         for n in data["nodes"]:
             raw_parent = n.get("parent")
-            parent_val = None if raw_parent is None or str(raw_parent) == 'None' or str(raw_parent) == '' else str(raw_parent)
-            node_type = "root" if parent_val is None else str(n.get("type", "node"))
-            G.add_node(str(n["id"]), type=node_type, parent=parent_val)
+            parent[str(n["id"])] = None if raw_parent is None or str(raw_parent) == 'None' or str(raw_parent) == '' else str(raw_parent)
 
-        for n in data["nodes"]:
-            if str(n["parent"]) != 'None':
-                G.add_edge(str(n["parent"]), str(n["id"]), source=str(n["parent"]), target=str(n["id"]), type="top")
+        top_edges = [(p, c) for c, p in parent.items() if p is not None]
+        bottom_edges = [(str(e["source"]), str(e["target"])) for e in data["edges"]]
 
-        for e in data["edges"]:
-            G.add_edge(str(e["source"]), str(e["target"]), source=str(e["source"]), target=str(e["target"]), type="bottom")
+        # A bottom edge that duplicates a tree edge takes precedence, as before
+        etype: Dict[Tuple[str, str], str] = {}
+        for e in top_edges:
+            etype[e] = "top"
+        for e in bottom_edges:
+            etype[e] = "bottom"
 
-        nodes = list(G.nodes())
-        edges = list(G.edges())
+        nodes = list(parent)
+        for u, v in etype:
+            for w in (u, v):
+                if w not in parent:
+                    parent[w] = None
+                    nodes.append(w)
+        edges = list(etype)
 
         # Identify leaf nodes
-        leaf_nodes: Set[str] = set()
-        has_children: Set[str] = set()
-        for u, v in G.edges():
-            if G[u][v]['type'] == 'top':  # u is parent of v
-                has_children.add(u)
-        leaf_nodes = set(nodes) - has_children
+        has_children: Set[str] = {p for p in parent.values() if p is not None}
+        leaf_nodes: Set[str] = set(nodes) - has_children
         print(f"DEBUG: {len(leaf_nodes)} leaf nodes identified: {sorted(leaf_nodes)}")
 
+        # Only vertex-disjoint bottom edges can cross. Without such a pair (at
+        # most one edge, a star, a triangle) every tree-consistent order is
+        # optimal, so skip building and solving a model altogether.
+        bottom = [e for e, t in etype.items() if t == "bottom"]
+        if not any(len({*e1, *e2}) == 4 for e1, e2 in combinations(bottom, 2)):
+            children: Dict[str, List[str]] = {u: [] for u in nodes}
+            for v, u in parent.items():
+                if u is not None:
+                    children[u].append(v)
+            full_order = []
+            stack = [u for u in reversed(nodes) if parent[u] is None]
+            while stack:
+                u = stack.pop()
+                full_order.append(u)
+                stack.extend(reversed(children[u]))
+            leaf_order = [node for node in full_order if node in leaf_nodes]
+            print(f"✅ Trivial instance ({len(bottom)} bottom edges, no possible crossings) - skipping ILP")
+            print(f"Leaf order: {leaf_order}")
+            return leaf_order
+
         start_time = time.time()
 
         # Setup Gurobi model
@@ -68,117 +157,87 @@ def solve_layout_for_graph(graph_json_path: str, time_limit: int = 3600) -> List
             m.Params.OutputFlag = 1
 
         m.Params.TimeLimit = time_limit
-        m.Params.Method = 2
-        m.Params.Threads = min(4, os.cpu_count() or 1)
+        m.Params.Method = 1  # dual simplex for the root LP
+        m.Params.Symmetry = 2  # equal-type nodes are largely interchangeable
+        m.Params.Cuts = 2
+        m.Params.MIPFocus = 1 if time_limit < 600 else 0
+        m.Params.NumericFocus = 1
+        m.Params.Threads = 0  # let Gurobi pick the thread count
         m.Params.MIPGap = 1e-4
         m.Params.Presolve = 2
 
         print(f"DEBUG: Creating ILP model with {len(nodes)} nodes...")
 
         # VARIABLES
-        x_nodes = {}
-        x_edges = {}
+        # Nodes and node pairs are mapped to integer columns so the whole model
+        # can be handed to Gurobi as sparse matrices in a few matrix-API calls.
+        node_index = {u: i for i, u in enumerate(nodes)}
+        N = len(nodes)
 
         def getKey(u, v):
-            return f"node *{u}* before *{v}*"
+            return pair_columns(node_index[u], node_index[v], N)
+
+        def getPair(k):
+            i, r = divmod(k, N - 1)
+            return nodes[i], nodes[r + 1 if r >= i else r]
 
-        for u, v in combinations(nodes, 2):
-            x_nodes[getKey(u, v)] = m.addVar(vtype=GRB.BINARY, name=getKey(u, v))  
-            x_nodes[getKey(v, u)] = m.addVar(vtype=GRB.BINARY, name=getKey(v, u))  
+        # Crossing variables only exist for bottom/bottom edge pairs: mixed pairs
+        # are unconstrained and not counted, and top/top pairs may never cross.
+        E = len(edges)
+        is_top = np.array([etype[e] == "top" for e in edges], dtype=bool)
+        p, q = np.triu_indices(E, 1)
+        bottom_pair = ~is_top[p] & ~is_top[q]
+        top_pair = is_top[p] & is_top[q]
 
-        def getEdgeKey(e1, e2):
-            return f"edges *{e1[0]}* *{e1[1]}* and *{e2[0]}* *{e2[1]}* cross"
+        n_node_vars = N * (N - 1)
+        n_vars = n_node_vars + int(bottom_pair.sum())
 
-        for e1, e2 in combinations(edges, 2):
-            x_edges[getEdgeKey(e1, e2)] = m.addVar(vtype=GRB.BINARY, name=getEdgeKey(e1, e2))
+        x = m.addMVar(n_vars, vtype=GRB.BINARY)
 
         # CONSTRAINTS
         print("DEBUG: Adding ordering constraints...")
-        for u, v in combinations(nodes, 2):
-            m.addConstr(x_nodes[getKey(u, v)] + x_nodes[getKey(v, u)] == 1, 
-                       name=f"node_pair_{u}_{v}")
+        eq_blocks = [ordering_block(N)]
 
         print("DEBUG: Adding tree constraints...")
         tree_constraints = 0
-        for u, v in combinations(nodes, 2):
-            if G.has_edge(u, v):
-                eData = G.get_edge_data(u, v)
-                if eData["source"] == str(u) and eData["target"] == str(v) and eData["type"] == "top":
-                    m.addConstr(x_nodes[getKey(u, v)] == 1, name=f"node_fixed_{u}_{v}")
-                    tree_constraints += 1
-            if G.has_edge(v, u):
-                eData = G.get_edge_data(v, u)
-                if eData["source"] == str(v) and eData["target"] == str(u) and eData["type"] == "top":
-                    m.addConstr(x_nodes[getKey(v, u)] == 1, name=f"node_fixed_{v}_{u}")
-                    tree_constraints += 1
+        for v, u in parent.items():
+            if u is not None and etype.get((u, v)) == "top":
+                m.addConstr(x[getKey(u, v)] == 1, name=f"node_fixed_{u}_{v}")
+                tree_constraints += 1
         print(f"DEBUG: Added {tree_constraints} tree constraints")
 
         print("DEBUG: Adding transitivity constraints...")
-        def addTransitivityConstr(m, a, b, c, x_nodes):
-            keyAB = getKey(a, b)
-            keyBC = getKey(b, c)
-            keyAC = getKey(a, c)
-            m.addConstr(x_nodes[keyAB] + x_nodes[keyBC] <= x_nodes[keyAC] + 1, 
-                       name=f"trans_{a}_{b}_{c}")
-
-        transitivity_constraints = 0
-        for a, b, c in combinations(nodes, 3):
-            addTransitivityConstr(m, a, b, c, x_nodes)
-            addTransitivityConstr(m, a, c, b, x_nodes)
-            addTransitivityConstr(m, b, a, c, x_nodes)
-            addTransitivityConstr(m, b, c, a, x_nodes)
-            addTransitivityConstr(m, c, a, b, x_nodes)
-            addTransitivityConstr(m, c, b, a, x_nodes)
-            transitivity_constraints += 6
+        le_blocks = [transitivity_block(N)]
+        transitivity_constraints = len(le_blocks[0][0])
         print(f"DEBUG: Added {transitivity_constraints} transitivity constraints")
 
         print("DEBUG: Adding crossing constraints...")
-        def getEdgeFromKey(key, edges_dict):
-            tmp = key.split("*")
-            e1S = tmp[1]
-            e1T = tmp[3]
-            e2S = tmp[5]
-            e2T = tmp[7]
-            return (e1S, e1T), (e2S, e2T)
-
-        def addCrossingConstr(m, x_edge, e1, e2, x_nodes): 
-            a, b = e1
-            c, d = e2
-            if a != c and a != d and b != c and b != d:
-                m.addConstr(x_nodes[getKey(a, c)] + x_nodes[getKey(c, b)] + x_nodes[getKey(b, d)] <= 2 + x_edge, name=f"crossing_1_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(b, c)] + x_nodes[getKey(c, a)] + x_nodes[getKey(a, d)] <= 2 + x_edge, name=f"crossing_2_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(a, d)] + x_nodes[getKey(d, b)] + x_nodes[getKey(b, c)] <= 2 + x_edge, name=f"crossing_3_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(b, d)] + x_nodes[getKey(d, a)] + x_nodes[getKey(a, c)] <= 2 + x_edge, name=f"crossing_4_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(c, a)] + x_nodes[getKey(a, d)] + x_nodes[getKey(d, b)] <= 2 + x_edge, name=f"crossing_5_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(c, b)] + x_nodes[getKey(b, d)] + x_nodes[getKey(d, a)] <= 2 + x_edge, name=f"crossing_6_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(d, a)] + x_nodes[getKey(a, c)] + x_nodes[getKey(c, b)] <= 2 + x_edge, name=f"crossing_7_{a}_{b}_{c}_{d}")
-                m.addConstr(x_nodes[getKey(d, b)] + x_nodes[getKey(b, c)] + x_nodes[getKey(c, a)] <= 2 + x_edge, name=f"crossing_8_{a}_{b}_{c}_{d}")
-                return 8
-            return 0
-
-        crossing_constraints = 0
-        for key in list(x_edges.keys()):
-            e1, e2 = getEdgeFromKey(key, edges)
-            e1Data = G.get_edge_data(e1[0], e1[1])
-            e2Data = G.get_edge_data(e2[0], e2[1])
-            
-            if e1Data["type"] == e2Data["type"]:
-                crossing_constraints += addCrossingConstr(m, x_edges[key], e1, e2, x_nodes)
-            if e1Data["type"] == "top" and e2Data["type"] == "top":
-                m.addConstr(x_edges[key] == 0, name=f"zero_{key}")
+        eu = np.array([node_index[u] for u, v in edges], dtype=np.int32)
+        ev = np.array([node_index[v] for u, v in edges], dtype=np.int32)
+        a, b, c, d = eu[p], ev[p], eu[q], ev[q]
+        # Self-loops never cross, and pair_columns(i, i, N) is not a valid column
+        disjoint = (a != b) & (c != d) & (a != c) & (a != d) & (b != c) & (b != d)
+        x_edge = n_node_vars + np.arange(n_vars - n_node_vars, dtype=np.int32)
+
+        sel = disjoint[bottom_pair]
+        bp, bq = p[bottom_pair][sel], q[bottom_pair][sel]
+        le_blocks.append(crossing_block(eu[bp], ev[bp], eu[bq], ev[bq], x_edge[sel], N))
+        sel = top_pair & disjoint
+        le_blocks.append(crossing_block(a[sel], b[sel], c[sel], d[sel], None, N))
+        crossing_constraints = len(le_blocks[-2][0]) + len(le_blocks[-1][0])
 
         print(f"DEBUG: Added {crossing_constraints} crossing constraints")
 
+        A_le, b_le = stack_blocks(le_blocks, n_vars)
+        A_eq, b_eq = stack_blocks(eq_blocks, n_vars)
+        m.addMConstr(A_le, x, GRB.LESS_EQUAL, b_le)
+        m.addMConstr(A_eq, x, GRB.EQUAL, b_eq)
+
         # OBJECTIVE: Minimize bottom edge crossings
         print("DEBUG: Setting objective...")
-        obj = gp.LinExpr()
-        for key in list(x_edges.keys()):
-            e1, e2 = getEdgeFromKey(key, edges)
-            e1Data = G.get_edge_data(e1[0], e1[1])
-            e2Data = G.get_edge_data(e2[0], e2[1])
-            if e1Data["type"] == "bottom" and e2Data["type"] == "bottom":
-                obj.add(x_edges[key])
-        m.setObjective(obj, GRB.MINIMIZE)
+        obj = np.zeros(n_vars)
+        obj[n_node_vars:] = 1.0
+        m.setMObjective(None, obj, 0.0, sense=GRB.MINIMIZE)
 
         # SOLVE
         print("DEBUG: Starting optimization...")
@@ -195,13 +254,13 @@ def solve_layout_for_graph(graph_json_path: str, time_limit: int = 3600) -> List
 
         # EXTRACT SOLUTION
         if m.status in [GRB.OPTIMAL, GRB.TIME_LIMIT] and m.SolCount > 0:
+            # One bulk read of the solution vector; only the columns set to 1
+            # are decoded back into node pairs
+            x_vals = x.X
+            chosen = np.flatnonzero(x_vals[:n_node_vars] > 0.95)
             GD = nx.DiGraph()
-            for v in m.getVars():
-                tmp = v.varName
-                if v.X > 0.95 and tmp.startswith('node'):
-                    v1 = tmp.split("*")[1]
-                    v2 = tmp.split("*")[3]
-                    GD.add_edge(v1, v2)
+            GD.add_nodes_from(nodes)
+            GD.add_edges_from(getPair(int(k)) for k in chosen)
 
             if nx.is_directed_acyclic_graph(GD):
                 full_order = list(nx.topological_sort(GD))
@@ -39,9 +39,17 @@ document.addEventListener("DOMContentLoaded", () => {
 });
 
 // --- Fetch order from server ---
+// Solvers run in the background on the server, which answers 202 until the order is ready
+const ORDER_POLL_INTERVAL_MS = 1000;
+
 async function getOrder(instance, solver = "heuristic") {
   try {
-    const response = await fetch(`/api/order/${instance}?method=${solver}`);
+    const url = `/api/order/${instance}?method=${solver}`;
+    let response = await fetch(url);
+    while (response.status === 202) {
+      await new Promise((resolve) => setTimeout(resolve, ORDER_POLL_INTERVAL_MS));
+      response = await fetch(url);
+    }
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
@@ -1,5 +1,6 @@
 
 import json
+import math
 import random
 import os
 
@@ -34,16 +35,32 @@ def generate_edges(leaf_ids, max_edges):
     Generate random edges between leaves.
     """
     edges = []
-    possible_pairs = [(u, v) for i, u in enumerate(leaf_ids) for v in leaf_ids[i+1:]]
-    num_edges = random.randint(1, min(max_edges, len(possible_pairs)))
-    chosen = random.sample(possible_pairs, num_edges)
+    L = len(leaf_ids)
+    num_pairs = L * (L - 1) // 2
+    num_edges = random.randint(1, min(max_edges, num_pairs))
 
-    for u, v in chosen:
-        edges.append({"source": u, "target": v})
+    # Sample linear pair indices and decode them, instead of materializing
+    # all O(L^2) leaf pairs
+    for idx in random.sample(range(num_pairs), num_edges):
+        i, j = pair_from_index(idx, L)
+        edges.append({"source": leaf_ids[i], "target": leaf_ids[j]})
 
     return edges
 
 
+def pair_from_index(idx, L):
+    """
+    Map a linear index into the pairs (i, j), i < j < L, enumerated row by
+    row, back to (i, j).
+    """
+    i = (2 * L - 1 - math.isqrt((2 * L - 1) ** 2 - 8 * idx)) // 2
+    # isqrt rounds down, which can leave i one row too far
+    if i * (2 * L - 1 - i) // 2 > idx:
+        i -= 1
+    j = idx - i * (2 * L - 1 - i) // 2 + i + 1
+    return i, j
+
+
 def generate_json_files(output_dir="data", num_files=10):
     os.makedirs(output_dir, exist_ok=True)
 
@@ -1,65 +1,63 @@
 from flask import Flask, send_from_directory, jsonify, request
+from werkzeug.exceptions import NotFound
+import glob
+import gzip
 import json
+import hashlib
+import logging
 import os
-import re
+import pickle
+import string
 import uuid
 import sys
-import io
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
 import networkx as nx
+from server_validation import validate_graph_structure, validate_graph_stream
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# Verbose request/solver traces are DEBUG and solver results INFO; both are
+# off unless enabled with e.g. LOG_LEVEL=INFO
+logging.basicConfig()
+log = logging.getLogger("hierarchytrix")
+log.setLevel(os.environ.get("LOG_LEVEL", "WARNING").upper())
+
+log.info("=== STARTING SERVER ===")
+
+# Allowed instance names and downloadable file names
+_ALLOWED_INSTANCE = frozenset(string.ascii_letters + string.digits + "_-")
+_MAX_INSTANCE_LEN = 128
+
+
+def _valid_instance(name):
+    return 0 < len(name) <= _MAX_INSTANCE_LEN and _ALLOWED_INSTANCE.issuperset(name)
+
+
+def _valid_filename(name):
+    return name.endswith(".json") and _valid_instance(name[:-5])
 
-print("=== STARTING SERVER ===")
-
-# --- Graph validation ---
-def validate_graph_structure(data):
-    if not isinstance(data, dict):
-        return False, "Root element must be a JSON object"
-
-    if "nodes" not in data or "edges" not in data:
-        return False, "Missing required keys: 'nodes' and/or 'edges'"
-
-    if not isinstance(data["nodes"], list) or not isinstance(data["edges"], list):
-        return False, "'nodes' and 'edges' must be lists"
-
-    node_ids = set()
-    for n in data["nodes"]:
-        if not all(k in n for k in ("id", "parent", "type")):
-            return False, "Each node must have 'id', 'parent', and 'type'"
-        node_ids.add(n["id"])
-
-    for n in data["nodes"]:
-        parent = n["parent"]
-        if parent is not None and parent not in node_ids:
-            return False, f"Parent '{parent}' of node '{n['id']}' not found"
-
-    graph = {n["id"]: n["parent"] for n in data["nodes"]}
-    def has_cycle(node_id, visited):
-        parent = graph.get(node_id)
-        if parent is None:
-            return False
-        if parent in visited:
-            return True
-        return has_cycle(parent, visited | {parent})
-    for nid in node_ids:
-        if has_cycle(nid, {nid}):
-            return False, f"Cycle detected in parent hierarchy starting at '{nid}'"
-
-    children_map = {}
-    for n in data["nodes"]:
-        parent = n["parent"]
-        if parent:
-            children_map.setdefault(parent, []).append(n["id"])
-    for n in data["nodes"]:
-        if n["type"] == "cluster":
-            if n["id"] not in children_map or len(children_map[n["id"]]) == 0:
-                return False, f"Cluster '{n['id']}' has no children"
-
-    for e in data["edges"]:
-        if not all(k in e for k in ("source", "target")):
-            return False, "Each edge must have 'source' and 'target'"
-        if e["source"] not in node_ids or e["target"] not in node_ids:
-            return False, f"Edge connects unknown node(s): {e}"
-
-    return True, "Graph structure is valid"
 
 # --- Add current directory to path ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -67,41 +65,337 @@ sys.path.insert(0, current_dir)
 
 try:
     from ILP_solver import solve_layout_for_graph
-    print("✓ ILP Solver imported successfully")
+    log.info("✓ ILP Solver imported successfully")
 except ImportError as e:
-    print(f"✗ ILP Solver import failed: {e}")
+    log.warning("✗ ILP Solver import failed: %s", e)
 
 try:
     from heuristic_solver import solve_layout_for_graph_heuristic
-    print("✓ Heuristic Solver imported successfully")
+    log.info("✓ Heuristic Solver imported successfully")
 except ImportError as e:
-    print(f"✗ Heuristic Solver import failed: {e}")
+    log.warning("✗ Heuristic Solver import failed: %s", e)
 try:
     from hybrid_solver import solve_layout_for_graph_hybrid
-    print("✓ Hybrid Solver imported successfully")
+    log.info("✓ Hybrid Solver imported successfully")
 except ImportError as e:
-    print(f"✗ Hybrid Solver import failed: {e}")
+    log.warning("✗ Hybrid Solver import failed: %s", e)
 
 # --- Flask app ---
 app = Flask(__name__, static_folder="public")
 
+# Static assets are not fingerprinted, so they are cached for a bounded time
+# and revalidated via ETag afterwards. Behind nginx/Apache, USE_X_SENDFILE=1
+# hands file bodies to the front-end server instead of streaming them here.
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = int(os.environ.get("STATIC_MAX_AGE", 3600))
+app.use_x_sendfile = os.environ.get("USE_X_SENDFILE") == "1"
+
+# Compress API responses (graphs, orders) and static assets when
+# flask-compress is installed; small responses are sent as-is
+if Compress is not None:
+    app.config.update(
+        COMPRESS_MIMETYPES=["application/json", "text/plain", "text/html", "text/css",
+                            "text/javascript", "application/javascript"],
+        COMPRESS_LEVEL=6,
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_ALGORITHM=["br", "gzip"],
+    )
+    Compress(app)
+
+# Resolved once at startup; request handlers only join file names onto them
 GRAPH_DIR = os.path.abspath(os.path.join("data", "graphs"))
-ORDER_DIR = os.path.join("data", "order")
+ORDER_DIR = os.path.abspath(os.path.join("data", "order"))
+ORDER_HASH_DIR = os.path.join(ORDER_DIR, "by_hash")
+GRAPH_PICKLE_DIR = os.path.abspath(os.path.join("data", "cache", "graphs"))
+GRAPH_GZIP_DIR = os.path.abspath(os.path.join("data", "cache", "gzip"))
 os.makedirs(GRAPH_DIR, exist_ok=True)
 os.makedirs(ORDER_DIR, exist_ok=True)
+os.makedirs(ORDER_HASH_DIR, exist_ok=True)
+os.makedirs(GRAPH_PICKLE_DIR, exist_ok=True)
+os.makedirs(GRAPH_GZIP_DIR, exist_ok=True)
+
+# Names of stored graphs, so uploads can pick a free name without probing the disk
+_USED_NAMES = {f[:-5] for f in os.listdir(GRAPH_DIR) if f.endswith(".json")}
+_USED_NAMES_LOCK = threading.Lock()
+
+# --- Background solver pools ---
+# Solves run in worker processes (each with its own Gurobi environment) so a
+# long ILP never blocks the request thread. Running jobs are tracked per
+# (instance, method) and polled by repeated /api/order requests; each key has
+# its own lock so concurrent requests never start the same solve twice.
+# ILP solves may run up to their time limit (an hour), so they get a pool of
+# their own and heuristic/hybrid solves never queue behind them.
+SOLVER_WORKERS = {
+    "ilp": max(1, (os.cpu_count() or 1) // 4),
+    "fast": max(2, (os.cpu_count() or 1) // 4),
+}
+ORDER_MAX_WAIT = 30  # upper bound (seconds) for /api/order?wait=N
+FAILED_JOB_TTL = 300  # seconds a failed job stays visible to status polls
+_solver_pools = {}
+_POOLS_LOCK = threading.Lock()
+PENDING = {}
+FAILED_JOBS = {}  # job key -> (monotonic time, error message)
+_ORDER_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def solver_kind(method):
+    return "ilp" if method == "ilp" else "fast"
+
+
+def get_solver_pool(kind):
+    # Created lazily so importing this module (e.g. in a worker) never spawns processes
+    with _POOLS_LOCK:
+        pool = _solver_pools.get(kind)
+        if pool is None:
+            pool = _solver_pools[kind] = ProcessPoolExecutor(max_workers=SOLVER_WORKERS[kind])
+        return pool
+
+
+def reset_solver_pool(kind, pool):
+    """
+    Drop a pool broken by a crashed worker (e.g. an OOM-killed ILP), so that
+    later solves get a fresh pool instead of failing with BrokenProcessPool.
+    """
+    with _POOLS_LOCK:
+        if _solver_pools.get(kind) is not pool:
+            return
+        del _solver_pools[kind]
+    log.warning("Solver pool %r is broken, starting a new one", kind)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_solve(instance, method):
+    kind = solver_kind(method)
+    pool = get_solver_pool(kind)
+    try:
+        future = pool.submit(generate_order, instance, method)
+    except BrokenProcessPool:
+        reset_solver_pool(kind, pool)
+        pool = get_solver_pool(kind)
+        future = pool.submit(generate_order, instance, method)
+
+    # Replace the pool as soon as a crash breaks it, not only on the next submit
+    def on_done(f):
+        if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+            reset_solver_pool(kind, pool)
+
+    future.add_done_callback(on_done)
+    return future
+
+
+def job_id(instance, method):
+    # Public id of the (instance, method) solve, see /api/order/status/<job_id>
+    return f"{instance}.{method}"
+
+
+def order_lock(job_key):
+    # One lock per (instance, method); the number of keys is bounded by the
+    # stored graphs, so locks are never evicted
+    with _LOCKS_GUARD:
+        return _ORDER_LOCKS.setdefault(job_key, threading.Lock())
+
+
+# --- In-process order cache ---
+# Warm /api/order hits are answered from memory. Keys include the graph file's
+# mtime, so an edited graph never gets a stale entry.
+ORDER_CACHE_SIZE = 1024
+_ORDER_CACHE = OrderedDict()
+_ORDER_CACHE_LOCK = threading.Lock()
+
+
+def order_cache_get(key):
+    with _ORDER_CACHE_LOCK:
+        order_string = _ORDER_CACHE.get(key)
+        if order_string is not None:
+            _ORDER_CACHE.move_to_end(key)
+        return order_string
+
+
+def order_cache_put(key, order_string):
+    with _ORDER_CACHE_LOCK:
+        _ORDER_CACHE[key] = order_string
+        _ORDER_CACHE.move_to_end(key)
+        while len(_ORDER_CACHE) > ORDER_CACHE_SIZE:
+            _ORDER_CACHE.popitem(last=False)
+
+
+def order_cache_invalidate(instance):
+    with _ORDER_CACHE_LOCK:
+        for key in [k for k in _ORDER_CACHE if k[0] == instance]:
+            del _ORDER_CACHE[key]
 
 
 # --- Helper: convert JSON graph to NetworkX DiGraph ---
 def dict_to_nx_graph(data):
     G = nx.DiGraph()
-    for n in data["nodes"]:
-        node_type = n.get("type") or "node"
-        G.add_node(str(n["id"]), type=node_type, parent=n.get("parent"))
-    for e in data["edges"]:
-        G.add_edge(str(e["source"]), str(e["target"]), type=e.get("type", "bottom"))
+    G.add_nodes_from((str(n["id"]), {"type": n.get("type") or "node", "parent": n.get("parent")})
+                     for n in data["nodes"])
+    G.add_edges_from((str(e["source"]), str(e["target"]), {"type": e.get("type", "bottom")})
+                     for e in data["edges"])
+    return G
+
+
+def _load_graph(path):
+    # Parse from bytes: orjson (when installed) takes them without a decode step
+    with open(path, "rb") as f:
+        return json_loads(f.read())
+
+
+@lru_cache(maxsize=64)
+def _load_graph_cached(path, mtime_ns, size):
+    """
+    Parse a graph file into a DiGraph, memoised per (path, mtime_ns, size) so
+    repeated solves of an unchanged graph skip the JSON parse. The cached graph
+    is shared: callers that mutate it must work on a copy.
+
+    The built graph is also pickled to GRAPH_PICKLE_DIR, so other solver
+    processes (and restarts) unpickle it instead of rebuilding it from JSON.
+    The pickle name carries the graph's exact mtime and size, so a replaced
+    graph never matches an older pickle.
+    """
+    base = os.path.basename(path)
+    pickled = os.path.join(GRAPH_PICKLE_DIR, f"{base}.{mtime_ns}.{size}.pkl")
+    try:
+        with open(pickled, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning("Ignoring unreadable graph pickle %s: %s", pickled, e)
+
+    G = dict_to_nx_graph(_load_graph(path))
+
+    tmp = f"{pickled}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, pickled)
+    except OSError as e:
+        log.warning("Could not store graph pickle %s: %s", pickled, e)
+
+    # Drop pickles of earlier versions of this graph
+    for old in glob.glob(os.path.join(GRAPH_PICKLE_DIR, f"{glob.escape(base)}.*.*.pkl")):
+        if old != pickled:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
     return G
 
 
+# --- Helper: content hash of a graph file (order cache key) ---
+@lru_cache(maxsize=256)
+def graph_content_hash(graph_file, mtime):
+    """
+    Hash the canonical JSON form of a graph, so that equivalent graphs share
+    cached orders and an edited graph never reuses a stale one. Memoised per
+    (path, mtime): status polls of an unchanged graph skip the re-hash.
+    """
+    with open(graph_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# --- Helpers: stored order files ---
+def read_stored_order(hash_path, filepath, graph_mtime):
+    """
+    Return the stored order for a graph, or None. The content-addressed file
+    wins; a file stored under the instance name only (e.g. shipped precomputed
+    orders) is used while it is still newer than the graph.
+    """
+    if hash_path:
+        try:
+            with open(hash_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            if graph_mtime is None or os.fstat(f.fileno()).st_mtime >= graph_mtime:
+                return f.read()
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def write_order_file(path, order_string):
+    # Write to a temporary file and rename it into place, so readers never
+    # see a partially written order
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(order_string)
+    os.replace(tmp, path)
+
+
+# --- Helper: pre-compressed graph files ---
+def gzipped_graph(instance):
+    """
+    Path of a gzip copy of a stored graph, created when missing, so repeated
+    fetches are not compressed again. The copy's name carries the graph's
+    exact mtime and size, so a replaced graph never matches an older copy.
+    Returns None if the graph does not exist.
+    """
+    src = os.path.join(GRAPH_DIR, f"{instance}.json")
+    try:
+        st = os.stat(src)
+    except FileNotFoundError:
+        return None
+    dst = os.path.join(GRAPH_GZIP_DIR, f"{instance}.{st.st_mtime_ns}.{st.st_size}.json.gz")
+    if os.path.exists(dst):
+        return dst
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(src, "rb") as f_in, gzip.open(tmp, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.replace(tmp, dst)
+
+    # Drop copies of earlier versions of this graph
+    for old in glob.glob(os.path.join(GRAPH_GZIP_DIR, f"{glob.escape(instance)}.*.*.json.gz")):
+        if old != dst:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return dst
+
+
+# --- Helper: names for uploaded graphs ---
+def allocate_graph_file(base):
+    """
+    Pick a free "<base>_<4 hex>" graph name and create its file with O_EXCL,
+    so neither a concurrent upload nor a file copied into the graph directory
+    can be overwritten. Returns (name, path, fd) with fd open for writing.
+    The base is cut so that the name stays within _MAX_INSTANCE_LEN.
+    """
+    base = base[:_MAX_INSTANCE_LEN - 5]
+    with _USED_NAMES_LOCK:
+        while True:
+            name = base+"_"+uuid.uuid4().hex[:4]
+            if name in _USED_NAMES:
+                continue
+            path = os.path.join(GRAPH_DIR, f"{name}.json")
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                _USED_NAMES.add(name)
+                continue
+            _USED_NAMES.add(name)
+            return name, path, fd
+
+
+def remove_order_files(instance):
+    # Every solver suffix at once. A glob on "<instance>_*" would also match
+    # graphs whose names extend this one ("x_ab12" vs "x_ab12_c3d4")
+    for suffix in ("_ilp", "_heuristic", "_hybrid"):
+        path = os.path.join(ORDER_DIR, f"{instance}{suffix}.txt")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.error("Could not remove order file %s: %s", path, e)
+
+
 # --- Generate order (ILP or heuristic) ---
 def generate_order(instance, method="ilp"):
     """
@@ -111,70 +405,77 @@ def generate_order(instance, method="ilp"):
     """
     graph_file = os.path.join(GRAPH_DIR, f"{instance}.json")
     if not os.path.exists(graph_file):
-        print(f"Graph file not found: {graph_file}")
+        log.warning("Graph file not found: %s", graph_file)
         return ""
 
     try:
         if method == "heuristic":
-            print("🎯 EXECUTING HEURISTIC SOLVER")
             try:
-                print(f"🔧 Running heuristic solver for {instance}")
-                G = dict_to_nx_graph(json.load(open(graph_file, "r", encoding="utf-8")))
-                layout = solve_layout_for_graph_heuristic(G)
+                log.debug("Running heuristic solver for %s", instance)
+                st = os.stat(graph_file)
+                G = _load_graph_cached(graph_file, st.st_mtime_ns, st.st_size)
+                # The heuristic adds missing tree edges to its input graph
+                layout = solve_layout_for_graph_heuristic(G.copy())
 
                 if not layout:
-                    print("Heuristic solver returned empty layout")
+                    log.warning("Heuristic solver returned empty layout for %s", instance)
                     return []
 
                 return " ".join(layout)
-            except Exception as e:
-                print(f"Error in heuristic solver: {e}")
-                import traceback
-                traceback.print_exc()
+            except Exception:
+                log.exception("Error in heuristic solver")
                 return []
 
         elif method == "hybrid":
-            print("EXECUTING HYBRID SOLVER")
             try:
-                print(f"Running TRUE HYBRID solver for {instance}")
+                log.debug("Running TRUE HYBRID solver for %s", instance)
                 hybrid_order = solve_layout_for_graph_hybrid(graph_file)
                 
                 if hybrid_order:
                     order_string = " ".join(hybrid_order)
-                    print(f"TRUE HYBRID order generated: {len(hybrid_order)} nodes")
+                    log.info("TRUE HYBRID order generated: %d nodes", len(hybrid_order))
                     return order_string
                 else:
-                    print("TRUE HYBRID solver failed, falling back to heuristic")
+                    log.warning("TRUE HYBRID solver failed, falling back to heuristic")
                     return generate_order(instance, "heuristic")
                     
-            except Exception as e:
-                print(f"Error in TRUE hybrid solver: {e}")
-                import traceback
-                traceback.print_exc()
+            except Exception:
+                log.exception("Error in TRUE hybrid solver")
                 return generate_order(instance, "heuristic")
 
         else:  # default ILP
-            print("EXECUTING ILP SOLVER")
-            print(f"Running ILP solver for {instance}")
+            log.debug("Running ILP solver for %s", instance)
             leaf_order = solve_layout_for_graph(graph_file)
             if not leaf_order:
-                print("ILP solver returned empty order")
+                log.warning("ILP solver returned empty order for %s", instance)
                 return ""
 
             order_string = " ".join(leaf_order)
-            print(f"ILP order generated: {len(leaf_order)} nodes")
+            log.info("ILP order generated: %d nodes", len(leaf_order))
             return order_string
 
-    except Exception as e:
-        print(f"Error in {method} solver: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error in %s solver", method)
         return ""
 
+# --- Helper: JSON responses ---
+def _json_response(obj, status=200):
+    # orjson serialises straight to bytes; without it use Flask's encoder
+    if orjson is None:
+        response = jsonify(obj)
+        response.status_code = status
+    else:
+        response = app.response_class(orjson.dumps(obj), status=status, mimetype="application/json")
+    # API answers change as solves finish; only files are cached
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
 # --- Flask routes ---
 @app.route("/")
 def serve_index():
-    return send_from_directory(app.static_folder, "index.html")
+    # Always revalidated (cheap 304s), so updated asset references are picked up
+    return send_from_directory(app.static_folder, "index.html", max_age=0)
 
 @app.route("/<path:path>")
 def serve_static(path):
@@ -182,69 +483,94 @@ def serve_static(path):
 
 @app.route("/api/graph/<instance>")
 def get_graph(instance):
-    if not re.fullmatch(r"[A-Za-z0-9_-]+", instance):
-        return jsonify({"error": "Invalid instance name"}), 400
-
-    filepath = os.path.join(GRAPH_DIR, f"{instance}.json")
-    abs_path = os.path.abspath(filepath)
-    if not abs_path.startswith(GRAPH_DIR):
-        return jsonify({"error": "Invalid instance path"}), 400
+    if not _valid_instance(instance):
+        return _json_response({"error": "Invalid instance name"}, 400)
 
+    # The stored file is already valid JSON: send its bytes as-is (with
+    # ETag/Last-Modified support) instead of parsing and re-serializing it
     try:
-        with open(abs_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify({"error": "Graph not found"}), 404
+        if request.accept_encodings["gzip"]:
+            try:
+                gz_path = gzipped_graph(instance)
+            except OSError as e:
+                log.warning("Could not gzip graph %s: %s", instance, e)
+                gz_path = None
+            if gz_path:
+                response = send_from_directory(GRAPH_GZIP_DIR, os.path.basename(gz_path),
+                                               mimetype="application/json", conditional=True, max_age=60)
+                response.headers["Content-Encoding"] = "gzip"
+                response.vary.add("Accept-Encoding")
+                return response
+        response = send_from_directory(GRAPH_DIR, f"{instance}.json", mimetype="application/json",
+                                       conditional=True, max_age=60)
+        response.vary.add("Accept-Encoding")
+        return response
+    except NotFound:
+        return _json_response({"error": "Graph not found"}, 404)
     except Exception as e:
-        return jsonify({"error": "Failed to load graph", "details": str(e)}), 500
+        return _json_response({"error": "Failed to load graph", "details": str(e)}, 500)
 
 
 @app.route("/api/order/<instance>")
 def get_order(instance):
-    if not re.fullmatch(r"[A-Za-z0-9_-]+", instance):
-        return jsonify({"error": "Invalid instance name"}), 400
+    if not _valid_instance(instance):
+        return _json_response({"error": "Invalid instance name"}, 400)
 
     # Retrieve the method from query parameters, defaulting to 'ilp' (if method is absent)
     method = request.args.get("method") or request.args.get("solver") or "input"
     method = method.lower()
-    
-    print(f"🔍 DEBUG: Requested method = '{method}'")
+    log.debug("Requested method = %s", method)
+    graph_file = os.path.join(GRAPH_DIR, f"{instance}.json")
      
     # --- Handle 'input' method explicitly by reading the graph file ---
     if method == "input":
-        graph_file = os.path.join(GRAPH_DIR, f"{instance}.json")
         try:
-            # 1. Open the original graph file
-            with open(graph_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            # 2. Extract the IDs of leaf nodes in the order they appear in the 'nodes' list.
-            node_order = [str(n['id']) for n in data['nodes'] if n.get('type') == 'leaf']
+            # 1. Open the original graph file; only the 'nodes' list is needed,
+            #    so stream it when ijson is available instead of loading the edges too
+            node_order, all_ids = [], []
+            with open(graph_file, "rb") as f:
+                nodes = ijson.items(f, "nodes.item", use_float=True) if ijson is not None else json_loads(f.read())['nodes']
+
+                # 2. Extract the IDs of leaf nodes in the order they appear in the 'nodes' list.
+                for n in nodes:
+                    node_id = str(n['id'])
+                    all_ids.append(node_id)
+                    if n.get('type') == 'leaf':
+                        node_order.append(node_id)
             order_string = " ".join(node_order)
             
-            if not node_order and data['nodes']:
+            if not node_order and all_ids:
                  # Fallback if 'type' is missing or inconsistent, assume all nodes are ordered.
-                 node_order = [str(n['id']) for n in data['nodes']]
+                 node_order = all_ids
                  order_string = " ".join(node_order)
-                 print("Warning: No nodes with type 'leaf' found. Using all node IDs from input order.")
+                 log.warning("No nodes with type 'leaf' found. Using all node IDs from input order.")
             elif not node_order:
-                return jsonify({"error": "Failed to get input order: Graph file is empty or invalid."}), 500
+                return _json_response({"error": "Failed to get input order: Graph file is empty or invalid."}, 500)
 
-            print(f"Input order generated: {len(node_order)} nodes")
+            log.debug("Input order generated: %d nodes", len(node_order))
             # 3. Return the input order
-            return jsonify({"order": order_string, "method": method})
+            return _json_response({"order": order_string, "method": method})
             
         except FileNotFoundError:
-            return jsonify({"error": "Graph not found for input order"}), 404
+            return _json_response({"error": "Graph not found for input order"}, 404)
         except Exception as e:
-            return jsonify({"error": "Failed to get input order", "details": str(e)}), 500
+            return _json_response({"error": "Failed to get input order", "details": str(e)}, 500)
 
     # --- Original Solver Logic (Only runs if method is not 'input') ---
     if method not in ["ilp", "heuristic", "hybrid"]:
         # If the method is not 'input' (handled above) AND not a valid solver
-        return jsonify({"error": "Invalid method. Use 'input', 'ilp', 'heuristic', or 'hybrid'"}), 400
+        return _json_response({"error": "Invalid method. Use 'input', 'ilp', 'heuristic', or 'hybrid'"}, 400)
 
+    return solver_order_response(instance, method)
+
+
+def solver_order_response(instance, method, start=True):
+    """
+    Answer with the stored order of a solver method, or with 202 "pending"
+    while its background solve runs. With start=False (status polls) no new
+    solve is started: a job that failed in the last FAILED_JOB_TTL seconds is
+    a 500 with its error, any other unknown job a 404.
+    """
     # Assign suffix for pre-computed files
     if method == "heuristic":
         suffix = "_heuristic"
@@ -253,121 +579,226 @@ def get_order(instance):
     else:  # ilp
         suffix = "_ilp"
 
+    graph_file = os.path.join(GRAPH_DIR, f"{instance}.json")
     filepath = os.path.join(ORDER_DIR, f"{instance}{suffix}.txt")
     try:
-        if os.path.isfile(filepath):
-            with open(filepath, "r", encoding="utf-8") as f:
-                order_string = f.read()
-        else:
-            order_string = generate_order(instance, method)
-            if order_string:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    content_to_write = order_string if isinstance(order_string, str) else " ".join(order_string)
-                    f.write(content_to_write)
-            else:
-                return jsonify({"error": f"{method.capitalize()} solver failed"}), 500
-
-        return jsonify({"order": order_string, "method": method})
+        try:
+            graph_mtime = os.path.getmtime(graph_file)
+        except FileNotFoundError:
+            graph_mtime = None
+        cache_key = (instance, method, graph_mtime)
+        order_string = order_cache_get(cache_key)
+        if order_string is not None:
+            return _json_response({"status": "done", "order": order_string, "method": method})
+
+        hash_path = None
+        if graph_mtime is not None:
+            try:
+                graph_hash = graph_content_hash(graph_file, graph_mtime)
+                hash_path = os.path.join(ORDER_HASH_DIR, f"{graph_hash}{suffix}.txt")
+            except FileNotFoundError:
+                pass
+
+        order_string = read_stored_order(hash_path, filepath, graph_mtime)
+        if order_string is None:
+            job_key = (instance, method)
+            with order_lock(job_key):
+                future = PENDING.get(job_key)
+                if future is None:
+                    # A concurrent request may have stored the order while we waited
+                    order_string = read_stored_order(hash_path, filepath, graph_mtime)
+                    if order_string is None:
+                        if not start:
+                            failed = FAILED_JOBS.get(job_key)
+                            if failed and time.monotonic() - failed[0] < FAILED_JOB_TTL:
+                                return _json_response({
+                                    "status": "failed",
+                                    "error": f"{method.capitalize()} solver failed",
+                                    "details": failed[1],
+                                }, 500)
+                            FAILED_JOBS.pop(job_key, None)
+                            return _json_response({"error": "Unknown job"}, 404)
+                        FAILED_JOBS.pop(job_key, None)
+                        future = PENDING[job_key] = submit_solve(instance, method)
+
+            if future is not None:
+                # ?wait=N holds the request up to N seconds before answering "pending"
+                wait = min(max(request.args.get("wait", 0, type=float), 0), ORDER_MAX_WAIT)
+                if wait and not future.done():
+                    futures_wait([future], timeout=wait)
+                if not future.done():
+                    return _json_response({"status": "pending", "method": method, "job_id": job_id(instance, method)}, 202)
+
+                with order_lock(job_key):
+                    # The first request to see the finished job takes it out of
+                    # PENDING, whatever its outcome, and stores its result
+                    owner = PENDING.get(job_key) is future
+                    if owner:
+                        del PENDING[job_key]
+                    try:
+                        result = future.result()
+                        error = None
+                    except Exception as e:
+                        log.error("%s solve for %s failed: %s", method, instance, e)
+                        result, error = "", str(e)
+                    order_string = result if isinstance(result, str) else " ".join(result)
+                    if owner and order_string:
+                        for path in (hash_path, filepath):
+                            if path:
+                                write_order_file(path, order_string)
+                    elif owner:
+                        FAILED_JOBS[job_key] = (time.monotonic(), error or "Solver returned no order")
+                if not order_string:
+                    response = {"status": "failed", "error": f"{method.capitalize()} solver failed"}
+                    if error:
+                        response["details"] = error
+                    return _json_response(response, 500)
+
+        order_cache_put(cache_key, order_string)
+        return _json_response({"status": "done", "order": order_string, "method": method})
 
     except Exception as e:
-        return jsonify({"error": "Failed to get order", "details": str(e)}), 500
+        log.exception("Failed to get %s order for %s", method, instance)
+        return _json_response({"error": "Failed to get order", "details": str(e)}, 500)
+
+
+@app.route("/api/order/status/<job>")
+def get_order_status(job):
+    # Job ids are "<instance>.<method>"; '.' never occurs in instance names
+    instance, _, method = job.rpartition(".")
+    if not _valid_instance(instance) or method not in ("ilp", "heuristic", "hybrid"):
+        return _json_response({"error": "Invalid job id"}, 400)
+    return solver_order_response(instance, method, start=False)
 
 
 @app.route("/api/upload", methods=["POST"])
 def upload_graph():
     if "file" not in request.files:
-        return jsonify({
+        return _json_response({
             "success": False,
             "message": "No file part provided"
-        }), 400
+        }, 400)
 
     file = request.files["file"]
     if file.filename == "":
-        return jsonify({
+        return _json_response({
             "success": False,
             "message": "No selected file"
-        }), 400
+        }, 400)
 
     if not file.filename.lower().endswith(".json"):
-        return jsonify({
+        return _json_response({
             "success": False,
             "message": "Only .json files are allowed"
-        }), 400
+        }, 400)
+
+    # Upload wird gestreamt geprüft und danach unverändert gespeichert. Werkzeug
+    # puffert Uploads bereits durchsuchbar; nur sonst selbst zwischenspeichern
+    # (bis 8 MB im Speicher, sonst auf Platte)
+    if file.stream.seekable():
+        spool = file.stream
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        shutil.copyfileobj(file.stream, spool)
 
     # JSON prüfen
     try:
-        file_content = file.read().decode("utf-8")
-        data = json.loads(file_content)
+        if ijson is not None:
+            is_valid, msg = validate_graph_stream(spool)
+        else:
+            spool.seek(0)
+            data = json_loads(spool.read())
     except Exception as e:
-        return jsonify({
+        spool.close()
+        return _json_response({
             "success": False,
             "message": "Invalid JSON format",
             "details": str(e)
-        }), 400
+        }, 400)
 
     # Struktur- & Konsistenzprüfung
-    is_valid, msg = validate_graph_structure(data)
+    if ijson is None:
+        is_valid, msg = validate_graph_structure(data)
+        del data
     if not is_valid:
-        return jsonify({
+        spool.close()
+        return _json_response({
             "success": False,
             "message": "Invalid graph structure",
             "details": msg
-        }), 400
+        }, 400)
 
-    # Zufälliger, 4-stelliger Dateiname (MOVED UP to be used for the order file)
+    # Zufälliger, 4-stelliger Dateiname; die Datei wird dabei exklusiv angelegt
     old_filename = file.filename.removesuffix(".json")
-    unique_name = old_filename+"_"+uuid.uuid4().hex[:4]
-    filename = f"{unique_name}.json"
-    os.makedirs(GRAPH_DIR, exist_ok=True)
-    save_path = os.path.join(GRAPH_DIR, filename)
-
-    # Ensure unique name *before* proceeding (checks against GRAPH_DIR files)
-    while os.path.exists(save_path):
-        unique_name = old_filename+"_"+uuid.uuid4().hex[:4]
-        filename = f"{unique_name}.json"
-        save_path = os.path.join(GRAPH_DIR, filename)
-
-    
-    # Stream neu setzen (zum Speichern)
-    file.stream = io.BytesIO(file_content.encode("utf-8"))
 
+    save_path = None
     try:
-        file.save(save_path)
+        unique_name, save_path, fd = allocate_graph_file(old_filename)
+        spool.seek(0)
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(spool, out)
     except Exception as e:
-        # Aufräumen, falls Teildatei entstanden ist
-        if os.path.exists(save_path):
+        # Aufräumen, falls Teildatei entstanden ist (für den neuen Namen
+        # existieren noch keine Order-Dateien)
+        if save_path:
             try:
-                # IMPORTANT: Clean up the order file too if graph save fails!
-                os.remove(os.path.join(ORDER_DIR, f"{unique_name}.txt"))
                 os.remove(save_path)
             except Exception as cleanup_err:
-                print(f"Cleanup failed: {cleanup_err}")
-        return jsonify({
+                log.error("Cleanup failed: %s", cleanup_err)
+            remove_order_files(unique_name)
+            with _USED_NAMES_LOCK:
+                _USED_NAMES.discard(unique_name)
+        return _json_response({
             "success": False,
             "message": "Failed to save file",
             "details": str(e)
-        }), 500
+        }, 500)
+    finally:
+        spool.close()
+
+    filename = f"{unique_name}.json"
+    # Orders left over from an earlier graph of the same name are stale
+    remove_order_files(unique_name)
+    order_cache_invalidate(unique_name)
 
-    return jsonify({
+    return _json_response({
         "success": True,
         "message": "File uploaded and validated successfully",
         "filename": filename
-    }), 201
+    }, 201)
 
 @app.route("/api/download/<filename>", methods=["GET"])
 def download_json(filename):
-    if not re.match(r"^[A-Za-z0-9_-]+\.json$", filename):
-        return jsonify({"success": False, "message": "Invalid file name or extension. Only .json files can be downloaded."}), 400
+    if not _valid_filename(filename):
+        return _json_response({"success": False, "message": "Invalid file name or extension. Only .json files can be downloaded."}, 400)
 
     try:
-        return send_from_directory(directory=GRAPH_DIR, path=filename, as_attachment=True)
-    except FileNotFoundError:
-        return jsonify({"success": False, "message": f"File '{filename}' not found."}), 404
+        # Conditional GET answers repeated downloads with 304; the body is
+        # streamed through the server's file wrapper (sendfile where available)
+        return send_from_directory(GRAPH_DIR, filename, as_attachment=True,
+                                   conditional=True, etag=True, max_age=3600)
+    except (NotFound, FileNotFoundError):
+        return _json_response({"success": False, "message": f"File '{filename}' not found."}, 404)
     except Exception as e:
-        return jsonify({"success": False, "message": f"An error occurred during download: {str(e)}"}), 500
+        return _json_response({"success": False, "message": f"An error occurred during download: {str(e)}"}, 500)
 
 
 if __name__ == "__main__":
     print("Server running on http://localhost:3000")
-    app.run(port=3000, debug=True)
+    if os.environ.get("FLASK_ENV") == "development":
+        # Development server with debugger and reloader, only on request
+        app.run(port=3000, debug=True)
+        sys.exit()
+    try:
+        from waitress import serve
+    except ImportError:
+        if os.environ.get("PROD"):
+            sys.exit("✗ waitress not installed. Install it, or serve wsgi:application with another "
+                     "WSGI server, e.g. gunicorn -w 1 -k gthread --threads 8 -b localhost:3000 wsgi:application")
+        print("✗ waitress not installed, falling back to the Flask development server")
+        app.run(port=3000)
+    else:
+        # Multi-threaded WSGI server: static files, graph fetches and order polls
+        # are served concurrently while solves run in the process pool
+        serve(app, host="localhost", port=3000, threads=8)
 
@@ -0,0 +1,122 @@
+"""
+Structural validation of uploaded graph files.
+
+Kept free of Flask and fully type-annotated so it can be compiled to a C
+extension with mypyc (``mypyc server_validation.py``); server.py imports
+whichever build is present.
+"""
+from collections import defaultdict
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Set, Tuple
+
+try:
+    import ijson  # type: ignore[import-untyped]
+except ImportError:
+    ijson = None
+
+
+def validate_graph_structure(data: Any) -> Tuple[bool, str]:
+    if not isinstance(data, dict):
+        return False, "Root element must be a JSON object"
+
+    if "nodes" not in data or "edges" not in data:
+        return False, "Missing required keys: 'nodes' and/or 'edges'"
+
+    if not isinstance(data["nodes"], list) or not isinstance(data["edges"], list):
+        return False, "'nodes' and 'edges' must be lists"
+
+    return validate_graph_items(data["nodes"], data["edges"])
+
+
+def validate_graph_items(nodes: Iterable[Dict[str, Any]], edges: Iterable[Dict[str, Any]]) -> Tuple[bool, str]:
+    """
+    Node and edge checks of validate_graph_structure. Each list is iterated
+    exactly once, so items streamed from an uploaded file work as well.
+    """
+    # Single pass over the nodes: ids, parent links, child counts and clusters.
+    # Parents not seen yet are re-checked once all ids are known.
+    node_ids: Set[Any] = set()
+    graph: Dict[Any, Any] = {}
+    children_count: Dict[Any, int] = defaultdict(int)
+    cluster_ids: List[Any] = []
+    unresolved: List[Tuple[Any, Any]] = []
+    for n in nodes:
+        if not ("id" in n and "parent" in n and "type" in n):
+            return False, "Each node must have 'id', 'parent', and 'type'"
+        nid = n["id"]
+        parent = n["parent"]
+        node_ids.add(nid)
+        graph[nid] = parent
+        if parent is not None and parent not in node_ids:
+            unresolved.append((nid, parent))
+        if parent:
+            children_count[parent] += 1
+        if n["type"] == "cluster":
+            cluster_ids.append(nid)
+
+    for nid, parent in unresolved:
+        if parent not in node_ids:
+            return False, f"Parent '{parent}' of node '{nid}' not found"
+
+    # Walk every parent chain once. Nodes on the current walk are marked 1,
+    # nodes already known to lead to a root are marked 2 and end later walks.
+    state: Dict[Any, int] = {}
+    for nid in graph:
+        path: List[Any] = []
+        node = nid
+        while node is not None and node not in state:
+            state[node] = 1
+            path.append(node)
+            node = graph[node]
+        if node is not None and state[node] == 1:
+            return False, f"Cycle detected in parent hierarchy starting at '{nid}'"
+        for node in path:
+            state[node] = 2
+
+    for cid in cluster_ids:
+        if not children_count.get(cid):
+            return False, f"Cluster '{cid}' has no children"
+
+    for e in edges:
+        if not ("source" in e and "target" in e):
+            return False, "Each edge must have 'source' and 'target'"
+        if e["source"] not in node_ids or e["target"] not in node_ids:
+            return False, f"Edge connects unknown node(s): {e}"
+
+    return True, "Graph structure is valid"
+
+
+def validate_graph_stream(stream: BinaryIO) -> Tuple[bool, str]:
+    """
+    Streaming counterpart of validate_graph_structure for uploaded files
+    (requires ijson). Only node ids and parent links are held in memory.
+    Raises on malformed JSON.
+    """
+    # Pass 1: check the top-level shape. JSON readers keep the last of repeated
+    # keys while the item passes below would see every occurrence, so repeated
+    # top-level keys are rejected; this needs the whole document to be read
+    stream.seek(0)
+    shape: Dict[str, str] = {}
+    keys: Set[str] = set()
+    for prefix, event, value in ijson.parse(stream):
+        if prefix == "" and event == "map_key":
+            if value in keys:
+                return False, f"Duplicate top-level key: '{value}'"
+            keys.add(value)
+        elif prefix in ("", "nodes", "edges") and prefix not in shape:
+            shape[prefix] = event
+
+    if shape.get("") != "start_map":
+        return False, "Root element must be a JSON object"
+
+    if "nodes" not in shape or "edges" not in shape:
+        return False, "Missing required keys: 'nodes' and/or 'edges'"
+
+    if shape["nodes"] != "start_array" or shape["edges"] != "start_array":
+        return False, "'nodes' and 'edges' must be lists"
+
+    # Passes 2 and 3: nodes, then edges, one item at a time
+    def items(prefix: str) -> Iterator[Dict[str, Any]]:
+        stream.seek(0)
+        yield from ijson.items(stream, prefix, use_float=True)
+
+    return validate_graph_items(items("nodes.item"), items("edges.item"))
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    waitress-serve --listen=localhost:3000 --threads=8 wsgi:application
+    gunicorn -w 1 -k gthread --threads 8 -b localhost:3000 wsgi:application
+
+Run from the repository root (data/ is resolved relative to it) and with a
+single worker process: running solves are tracked in that process, so order
+polls landing in another worker would start the same solve again. Solves
+already run in their own process pool, threads serve everything else.
+"""
+from server import app as application